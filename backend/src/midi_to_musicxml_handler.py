@@ -1,13 +1,30 @@
 import base64
+import functools
 import json
 import os
-import sys
-import tempfile
 import re
-import xml.etree.ElementTree as ET
+import sys
 from pathlib import Path
 from typing import Any, Dict, Optional
 
+# score-part children that OSMD expects at most once.
+_SINGLE_INSTRUMENT_TAGS = ("score-instrument", "midi-instrument")
+
+# Request content types accepted as a raw MIDI body instead of JSON.
+_RAW_MIDI_CONTENT_TYPES = ("audio/midi", "application/octet-stream")
+
+# Lightweight guardrail (API Gateway payloads are limited anyway).
+_MAX_MIDI_BYTES = 2_000_000
+# Longest base64 text that can decode to _MAX_MIDI_BYTES, so oversized
+# payloads are rejected without allocating the decoded buffer.
+_MAX_MIDI_BASE64_CHARS = 4 * -(-_MAX_MIDI_BYTES // 3)
+# Padded standard-alphabet base64, checked before decoding so malformed input
+# is rejected by one scan instead of an allocating decode.
+_BASE64_RE = re.compile(r"\A[A-Za-z0-9+/]*={0,2}\Z")
+
+# Set once the serverless-offline requirements dir has been checked.
+_SYSPATH_PATCHED = False
+
 
 def _maybe_add_local_serverless_requirements_to_syspath() -> None:
   """Make serverless-offline behave closer to deployed Lambda.
@@ -15,8 +32,14 @@ def _maybe_add_local_serverless_requirements_to_syspath() -> None:
   In AWS, packaged dependencies live in /var/task and are importable by default.
   In serverless-offline, the Python function often runs from source without
   automatically adding the packaged requirements directory to sys.path.
+  Only the first call does any work.
   """
 
+  global _SYSPATH_PATCHED
+  if _SYSPATH_PATCHED:
+    return
+  _SYSPATH_PATCHED = True
+
   # backend/src/midi_to_musicxml_handler.py -> backend/
   backend_root = Path(__file__).resolve().parents[1]
   req_dir = backend_root / ".serverless" / "requirements"
@@ -26,17 +49,76 @@ def _maybe_add_local_serverless_requirements_to_syspath() -> None:
       sys.path.insert(0, p)
 
 
-def _get_allowed_origins() -> list[str]:
+# Patch sys.path before any third-party import: under serverless-offline,
+# lxml, orjson and music21 only exist in .serverless/requirements.
+_maybe_add_local_serverless_requirements_to_syspath()
+
+try:
+  # libxml2-backed parser/serializer; much faster than the stdlib on large scores.
+  import lxml.etree as ET  # type: ignore
+
+  _HAVE_LXML = True
+except ImportError:
+  import xml.etree.ElementTree as ET
+
+  _HAVE_LXML = False
+
+try:
+  # C JSON codec; noticeably faster than json on multi-MB response bodies.
+  import orjson  # type: ignore
+except ImportError:
+  orjson = None
+
+# Import music21 at module scope so the (slow) import runs during Lambda init
+# instead of on the first request. A failed import is reported per request.
+try:
+  from music21 import converter as _m21_converter  # type: ignore
+  from music21.musicxml.m21ToXml import (  # type: ignore
+      GeneralObjectExporter as _M21Exporter,
+  )
+
+  _M21_IMPORT_ERROR: Optional[ImportError] = None
+except ImportError as e:
+  _m21_converter = None
+  _M21Exporter = None
+  _M21_IMPORT_ERROR = e
+
+
+def _parse_allowed_origins() -> list[str]:
   raw = os.environ.get("ALLOWED_ORIGINS", "")
   return [o.strip() for o in raw.split(",") if o.strip()]
 
 
-def _get_request_origin(event: Dict[str, Any]) -> Optional[str]:
+# ALLOWED_ORIGINS is fixed for the lifetime of a Lambda container, so parse it
+# once instead of on every response.
+@functools.lru_cache(maxsize=1)
+def _get_allowed_origins() -> frozenset[str]:
+  return frozenset(_parse_allowed_origins())
+
+
+@functools.lru_cache(maxsize=1)
+def _get_default_origin() -> str:
+  # Keep the configured order here; frozenset iteration order is arbitrary.
+  origins = _parse_allowed_origins()
+  return origins[0] if origins else "*"
+
+
+def _get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+  """Look up a lowercase header name, also trying its canonical casing.
+
+  REST API events keep the client's header casing, e.g. "Content-Type".
+  """
+
   headers = event.get("headers") or {}
-  if not isinstance(headers, dict):
+  # API Gateway always hands us a plain dict; check that before isinstance.
+  if headers.__class__ is not dict and not isinstance(headers, dict):
     return None
-  origin = headers.get("origin") or headers.get("Origin")
-  return origin if isinstance(origin, str) else None
+  value = headers.get(name) or headers.get(name.title())
+  return value if type(value) is str else None
+
+
+def _get_request_origin(event: Dict[str, Any]) -> Optional[str]:
+  return _get_header(event, "origin")
 
 
 def _cors_headers(event: Dict[str, Any], allow_methods: str) -> Dict[str, str]:
@@ -44,10 +126,8 @@ def _cors_headers(event: Dict[str, Any], allow_methods: str) -> Dict[str, str]:
   request_origin = _get_request_origin(event)
   if request_origin and request_origin in allowed:
     allow_origin = request_origin
-  elif allowed:
-    allow_origin = allowed[0]
   else:
-    allow_origin = "*"
+    allow_origin = _get_default_origin()
 
   return {
       "content-type": "application/json; charset=utf-8",
@@ -58,6 +138,13 @@ def _cors_headers(event: Dict[str, Any], allow_methods: str) -> Dict[str, str]:
   }
 
 
+def _json_dumps(body: Any) -> str:
+  if orjson is not None:
+    # API Gateway wants a str body unless isBase64Encoded is set.
+    return orjson.dumps(body).decode("utf-8")
+  return json.dumps(body)
+
+
 def _json_response(
     event: Dict[str, Any],
     status_code: int,
@@ -67,13 +154,13 @@ def _json_response(
   return {
       "statusCode": status_code,
       "headers": _cors_headers(event, allow_methods),
-      "body": json.dumps(body),
+      "body": _json_dumps(body),
   }
 
 
 def _read_json_body(event: Dict[str, Any]) -> Dict[str, Any]:
   raw = event.get("body") or ""
-  if not isinstance(raw, str):
+  if raw.__class__ is not str and not isinstance(raw, str):
     raise ValueError("Request body must be a string")
 
   is_b64 = bool(event.get("isBase64Encoded"))
@@ -84,35 +171,47 @@ def _read_json_body(event: Dict[str, Any]) -> Dict[str, Any]:
       raise ValueError(f"Invalid base64 request body: {e!r}") from e
 
   try:
-    data = json.loads(raw)
+    data = orjson.loads(raw) if orjson is not None else json.loads(raw)
   except Exception as e:
     raise ValueError(f"Invalid JSON body: {e!r}") from e
 
-  if not isinstance(data, dict):
+  # json.loads only ever produces plain dicts for objects.
+  if type(data) is not dict:
     raise ValueError("JSON body must be an object")
   return data
 
 
-def _midi_bytes_to_musicxml(midi_bytes: bytes) -> str:
-  _maybe_add_local_serverless_requirements_to_syspath()
-  # Import inside the function so import errors become request errors.
-  from music21 import converter  # type: ignore
+def _read_binary_body(event: Dict[str, Any]) -> bytes:
+  raw = event.get("body") or ""
+  if raw.__class__ is not str and not isinstance(raw, str):
+    raise ValueError("Request body must be a string")
+
+  if event.get("isBase64Encoded"):
+    try:
+      return base64.b64decode(raw)
+    except Exception as e:
+      raise ValueError(f"Invalid base64 request body: {e!r}") from e
 
-  with tempfile.TemporaryDirectory(prefix="music21_") as tmpdir:
-    tmp = Path(tmpdir)
-    midi_path = tmp / "input.mid"
-    out_path = tmp / "output.musicxml"
+  # Without a matching binaryMediaTypes entry the body arrives as text.
+  try:
+    return raw.encode("latin-1")
+  except UnicodeEncodeError as e:
+    raise ValueError(f"Invalid binary request body: {e!r}") from e
 
-    midi_path.write_bytes(midi_bytes)
 
-    score = converter.parse(str(midi_path))
-    score.write("musicxml", fp=str(out_path))
+def _midi_bytes_to_musicxml(midi_bytes: bytes) -> bytes:
+  if _m21_converter is None or _M21Exporter is None:
+    raise ImportError(
+        f"Failed to import music21: {_M21_IMPORT_ERROR!r}"
+    ) from _M21_IMPORT_ERROR
 
-    xml_text = out_path.read_text(encoding="utf-8")
-    return _sanitize_musicxml_for_osmd(xml_text)
+  # Parse from and export to memory; nothing touches the Lambda tmpfs.
+  score = _m21_converter.parse(midi_bytes, format="midi")
+  xml_bytes = _M21Exporter(score).parse()
+  return _sanitize_musicxml_for_osmd(xml_bytes)
 
 
-def _sanitize_musicxml_for_osmd(xml_text: str) -> str:
+def _sanitize_musicxml_for_osmd(xml_bytes: bytes) -> bytes:
   """Best-effort normalization for OpenSheetMusicDisplay.
 
   music21 can emit MusicXML 4.0 with a DOCTYPE plus multi-instrument metadata
@@ -122,38 +221,76 @@ def _sanitize_musicxml_for_osmd(xml_text: str) -> str:
   - per-note <instrument> tags are removed
   """
 
-  # ElementTree can't reliably parse strings containing a DOCTYPE, so drop it.
   # MusicXML exports commonly include:
   #   <!DOCTYPE score-partwise PUBLIC "..." "http://www.musicxml.org/dtds/partwise.dtd">
-  cleaned = re.sub(r"<!DOCTYPE[\s\S]*?>", "", xml_text).strip()
-
+  # Both parsers accept it without loading the external DTD, and neither
+  # serializer writes it back out, so it needs no separate stripping pass.
   try:
-    root = ET.fromstring(cleaned)
+    if _HAVE_LXML:
+      root = ET.fromstring(
+          xml_bytes,
+          parser=ET.XMLParser(
+              huge_tree=False,
+              remove_blank_text=False,
+              # Skip the DOCTYPE's external DTD entirely; never fetch anything.
+              load_dtd=False,
+              resolve_entities=False,
+              no_network=True,
+          ),
+      )
+    else:
+      root = ET.fromstring(xml_bytes)
   except Exception:
-    # If parsing fails, fall back to just stripping the DOCTYPE.
-    return cleaned
+    # If parsing fails, return the export untouched.
+    return xml_bytes
 
-  # Collapse multi-instrument declarations to the first instrument.
-  for score_part in root.findall("./part-list/score-part"):
-    score_instruments = score_part.findall("score-instrument")
-    for extra in score_instruments[1:]:
-      score_part.remove(extra)
+  _sanitize_subtree(root)
 
-    midi_instruments = score_part.findall("midi-instrument")
-    for extra in midi_instruments[1:]:
-      score_part.remove(extra)
+  return ET.tostring(root, encoding="utf-8", xml_declaration=True)
 
-  # Remove per-note instrument switches and non-standard attributes that can
-  # trip up some renderers.
-  for note in root.findall(".//note"):
-    if "dynamics" in note.attrib:
-      del note.attrib["dynamics"]
 
-    for inst in list(note.findall("instrument")):
-      note.remove(inst)
+def _sanitize_subtree(elem: Any) -> None:
+  part_list = elem.find("part-list")
+  if part_list is not None:
+    _collapse_score_part_instruments(part_list)
+  _strip_note_instruments(elem)
 
-  return ET.tostring(root, encoding="utf-8", xml_declaration=True).decode(
-      "utf-8"
+
+def _collapse_score_part_instruments(part_list: Any) -> None:
+  # Collapse multi-instrument declarations to the first instrument.
+  # Children are filtered in one pass and replaced with a single slice
+  # assignment; remove() in a loop rescans the child list for every element.
+  for score_part in part_list.iterfind("score-part"):
+    seen: set[str] = set()
+    kept = []
+    for child in score_part:
+      if child.tag in _SINGLE_INSTRUMENT_TAGS:
+        if child.tag in seen:
+          continue
+        seen.add(child.tag)
+      kept.append(child)
+    if len(kept) != len(score_part):
+      score_part[:] = kept
+
+
+def _strip_note_instruments(elem: Any) -> None:
+  # Remove per-note instrument switches and non-standard attributes that can
+  # trip up some renderers. iter() is a lazy tag-filtered walk; edits only
+  # touch the current note's children, which it has not visited yet.
+  for note in elem.iter("note"):
+    note.attrib.pop("dynamics", None)
+
+    kept = [child for child in note if child.tag != "instrument"]
+    if len(kept) != len(note):
+      note[:] = kept
+
+
+def _payload_size_error(event: Dict[str, Any]) -> Dict[str, Any]:
+  return _json_response(
+      event,
+      400,
+      {"ok": False, "error": "MIDI payload too large or empty."},
+      "POST,OPTIONS",
   )
 
 
@@ -170,40 +307,59 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
           "POST,OPTIONS",
       )
 
-    body = _read_json_body(event)
-    midi_b64 = body.get("midiBase64")
-    if not isinstance(midi_b64, str) or not midi_b64.strip():
-      return _json_response(
-          event,
-          400,
-          {"ok": False, "error": "Missing 'midiBase64'"},
-          "POST,OPTIONS",
-      )
-
-    try:
-      midi_bytes = base64.b64decode(midi_b64)
-    except Exception:
-      return _json_response(
-          event,
-          400,
-          {"ok": False, "error": "Invalid base64 in 'midiBase64'"},
-          "POST,OPTIONS",
+    content_type = (_get_header(event, "content-type") or "").lower()
+    if content_type.startswith(_RAW_MIDI_CONTENT_TYPES):
+      # Raw MIDI upload: skip the JSON envelope and the inner base64 layer.
+      max_body_chars = (
+          _MAX_MIDI_BASE64_CHARS
+          if event.get("isBase64Encoded")
+          else _MAX_MIDI_BYTES
       )
-
-    if len(midi_bytes) == 0 or len(midi_bytes) > 2_000_000:
-      return _json_response(
-          event,
-          400,
-          {"ok": False, "error": "MIDI payload too large or empty."},
-          "POST,OPTIONS",
-      )
-
-    musicxml = _midi_bytes_to_musicxml(midi_bytes)
+      if len(event.get("body") or "") > max_body_chars:
+        return _payload_size_error(event)
+      midi_bytes = _read_binary_body(event)
+    else:
+      body = _read_json_body(event)
+      midi_b64 = body.get("midiBase64")
+      if not isinstance(midi_b64, str) or not midi_b64.strip():
+        return _json_response(
+            event,
+            400,
+            {"ok": False, "error": "Missing 'midiBase64'"},
+            "POST,OPTIONS",
+        )
+
+      if len(midi_b64) > _MAX_MIDI_BASE64_CHARS:
+        return _payload_size_error(event)
+
+      if len(midi_b64) % 4 or not _BASE64_RE.match(midi_b64):
+        return _json_response(
+            event,
+            400,
+            {"ok": False, "error": "Invalid base64 in 'midiBase64'"},
+            "POST,OPTIONS",
+        )
+
+      # The regex already validated the input; keep the handler as a safety net.
+      try:
+        midi_bytes = base64.b64decode(midi_b64, validate=False)
+      except Exception:
+        return _json_response(
+            event,
+            400,
+            {"ok": False, "error": "Invalid base64 in 'midiBase64'"},
+            "POST,OPTIONS",
+        )
+
+    if len(midi_bytes) == 0 or len(midi_bytes) > _MAX_MIDI_BYTES:
+      return _payload_size_error(event)
+
+    # Plain XML text for every client; API Gateway gzips large responses
+    # (minimumCompressionSize in serverless.yml), and XML compresses far
+    # better than its base64 would.
+    musicxml = _midi_bytes_to_musicxml(midi_bytes).decode("utf-8")
     return _json_response(
-        event,
-        200,
-        {"ok": True, "musicxml": musicxml},
-        "POST,OPTIONS",
+        event, 200, {"ok": True, "musicxml": musicxml}, "POST,OPTIONS"
     )
 
   except Exception as e:
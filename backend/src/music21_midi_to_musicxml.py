@@ -1,36 +1,80 @@
 import sys
-import tempfile
-import re
-import xml.etree.ElementTree as ET
-from pathlib import Path
+from typing import Any
 
+try:
+  # libxml2-backed parser/serializer; much faster than the stdlib on large scores.
+  import lxml.etree as ET  # type: ignore
 
-def sanitize_musicxml_for_osmd(xml_text: str) -> str:
+  _HAVE_LXML = True
+except ImportError:
+  import xml.etree.ElementTree as ET
+
+  _HAVE_LXML = False
+
+
+# score-part children that OSMD expects at most once.
+_SINGLE_INSTRUMENT_TAGS = ("score-instrument", "midi-instrument")
+
+# What ElementTree writes for xml_declaration=True. Prepending it ourselves
+# lets tostring() serialize just the tree, straight to str.
+_XML_DECLARATION = "<?xml version='1.0' encoding='utf-8'?>\n"
+
+
+def sanitize_musicxml_for_osmd(xml_bytes: bytes) -> str:
   # Best-effort normalization for OpenSheetMusicDisplay.
-  cleaned = re.sub(r"<!DOCTYPE[\s\S]*?>", "", xml_text).strip()
+  # The DOCTYPE is parsed (not fetched) and never serialized back out.
   try:
-    root = ET.fromstring(cleaned)
+    if _HAVE_LXML:
+      root = ET.fromstring(
+          xml_bytes,
+          parser=ET.XMLParser(
+              load_dtd=False, resolve_entities=False, no_network=True
+          ),
+      )
+    else:
+      root = ET.fromstring(xml_bytes)
   except Exception:
-    return cleaned
+    return xml_bytes.decode("utf-8")
+
+  _sanitize_subtree(root)
 
-  for score_part in root.findall("./part-list/score-part"):
-    score_instruments = score_part.findall("score-instrument")
-    for extra in score_instruments[1:]:
-      score_part.remove(extra)
+  return _XML_DECLARATION + ET.tostring(root, encoding="unicode")
 
-    midi_instruments = score_part.findall("midi-instrument")
-    for extra in midi_instruments[1:]:
-      score_part.remove(extra)
 
-  for note in root.findall(".//note"):
-    if "dynamics" in note.attrib:
-      del note.attrib["dynamics"]
-    for inst in list(note.findall("instrument")):
-      note.remove(inst)
+def _sanitize_subtree(elem: Any) -> None:
+  part_list = elem.find("part-list")
+  if part_list is not None:
+    _collapse_score_part_instruments(part_list)
+  _strip_note_instruments(elem)
 
-  return ET.tostring(root, encoding="utf-8", xml_declaration=True).decode(
-      "utf-8"
-  )
+
+def _collapse_score_part_instruments(part_list: Any) -> None:
+  # Collapse multi-instrument declarations to the first instrument.
+  # Children are filtered in one pass and replaced with a single slice
+  # assignment; remove() in a loop rescans the child list for every element.
+  for score_part in part_list.iterfind("score-part"):
+    seen: set[str] = set()
+    kept = []
+    for child in score_part:
+      if child.tag in _SINGLE_INSTRUMENT_TAGS:
+        if child.tag in seen:
+          continue
+        seen.add(child.tag)
+      kept.append(child)
+    if len(kept) != len(score_part):
+      score_part[:] = kept
+
+
+def _strip_note_instruments(elem: Any) -> None:
+  # Remove per-note instrument switches and non-standard attributes that can
+  # trip up some renderers. iter() is a lazy tag-filtered walk; edits only
+  # touch the current note's children, which it has not visited yet.
+  for note in elem.iter("note"):
+    note.attrib.pop("dynamics", None)
+
+    kept = [child for child in note if child.tag != "instrument"]
+    if len(kept) != len(note):
+      note[:] = kept
 
 
 def main() -> int:
@@ -42,6 +86,7 @@ def main() -> int:
 
   try:
     from music21 import converter  # type: ignore
+    from music21.musicxml.m21ToXml import GeneralObjectExporter  # type: ignore
   except Exception as e:
     sys.stderr.write(
         "Failed to import music21. Install it with: python3 -m pip install music21\n"
@@ -50,19 +95,10 @@ def main() -> int:
     return 3
 
   try:
-    with tempfile.TemporaryDirectory(prefix="music21_") as tmpdir:
-      tmp = Path(tmpdir)
-      midi_path = tmp / "input.mid"
-      out_path = tmp / "output.musicxml"
-
-      midi_path.write_bytes(midi_bytes)
-
-      score = converter.parse(str(midi_path))
-      score.write("musicxml", fp=str(out_path))
-
-      xml_text = out_path.read_text(encoding="utf-8")
-      xml_text = sanitize_musicxml_for_osmd(xml_text)
-      sys.stdout.write(xml_text)
+    score = converter.parse(midi_bytes, format="midi")
+    xml_bytes = GeneralObjectExporter(score).parse()
+    xml_text = sanitize_musicxml_for_osmd(xml_bytes)
+    sys.stdout.write(xml_text)
 
     return 0
   except Exception as e:
@@ -21,7 +21,7 @@ import {
   type ScheduledNote,
 } from "./midiCsv";
 
-import { midiBytesToBase64, midiCsvToMidiFileBytes } from "./midiFile";
+import { midiCsvToMidiFileBytes } from "./midiFile";
 
 import {
   GM_DRUM_CHANNEL,
@@ -37,6 +37,11 @@ type SheetTab = {
   musicXml: string;
 };
 
+// Parts converted to MusicXML at once. Browsers queue anything past ~6
+// requests per host over HTTP/1.1 (where a queued part's timeout is already
+// running), and every concurrent request is its own Lambda cold start.
+const SHEET_CONVERT_CONCURRENCY = 3;
+
 const DEFAULT_CSV = `# Paste your MIDI CSV here (midicsv output style)
 0, 0, Header, 1, 2, 480
 1, 0, Start_track
@@ -104,6 +109,7 @@ function App() {
   const sheetContainerRef = useRef<HTMLDivElement | null>(null);
   const osmdRef = useRef<unknown | null>(null);
   const sheetRenderTokenRef = useRef<number>(0);
+  const sheetConvertAbortRef = useRef<AbortController | null>(null);
 
   const activeMusicXml = useMemo(() => {
     if (!activeSheetId) return null;
@@ -602,6 +608,78 @@ function App() {
     setStatus("Idle");
   }
 
+  async function convertPartToMusicXml(
+    baseUrl: string,
+    part: { id: string; label: string; csv: string },
+    signal: AbortSignal
+  ): Promise<
+    | { ok: true; tab: SheetTab; warnings: string | null }
+    | { ok: false; error: string }
+  > {
+    const midiBytes = midiCsvToMidiFileBytes(part.csv);
+
+    // Abort on our own timeout, or when the run aborts every part at once.
+    const controller = new AbortController();
+    const abort = () => controller.abort();
+    if (signal.aborted) abort();
+    signal.addEventListener("abort", abort);
+    const timeoutId = window.setTimeout(abort, 28_000);
+
+    const res = await fetch(`${baseUrl}/midi-to-musicxml`, {
+      method: "POST",
+      // Send the MIDI file as-is; the backend also still accepts the
+      // older `{ midiBase64 }` JSON body.
+      headers: {
+        "content-type": "audio/midi",
+        accept: "application/json",
+      },
+      body: midiBytes as Uint8Array<ArrayBuffer>,
+      signal: controller.signal,
+    }).finally(() => {
+      window.clearTimeout(timeoutId);
+      signal.removeEventListener("abort", abort);
+    });
+
+    const text = await res.text();
+    if (!res.ok) {
+      return { ok: false, error: `HTTP ${res.status} (${part.label}): ${text}` };
+    }
+
+    let data: unknown;
+    try {
+      data = JSON.parse(text);
+    } catch {
+      return {
+        ok: false,
+        error: `Backend returned non-JSON (${part.label}):\n\n${text}`,
+      };
+    }
+
+    const obj = data as {
+      ok?: unknown;
+      musicxml?: unknown;
+      warnings?: unknown;
+    };
+    const musicXml = obj.musicxml;
+    if (obj.ok !== true || typeof musicXml !== "string") {
+      return {
+        ok: false,
+        error: `Unexpected response (${part.label}):\n\n${text}`,
+      };
+    }
+
+    const warnings =
+      typeof obj.warnings === "string" && obj.warnings.trim().length > 0
+        ? obj.warnings.trim()
+        : null;
+
+    return {
+      ok: true,
+      tab: { id: part.id, label: part.label, musicXml },
+      warnings,
+    };
+  }
+
   async function toSheetMusicFromCsv() {
     setErrorDetails(null);
 
@@ -614,6 +692,12 @@ function App() {
     setSheetTabs([]);
     setActiveSheetId(null);
 
+    // Abort any conversion still running from a previous click.
+    sheetConvertAbortRef.current?.abort();
+    const runController = new AbortController();
+    sheetConvertAbortRef.current = runController;
+    const isLatestRun = () => sheetConvertAbortRef.current === runController;
+
     const baseUrl =
       (import.meta.env.VITE_BACKEND_URL as string | undefined) ??
       "http://localhost:3000/dev";
@@ -625,68 +709,73 @@ function App() {
         return;
       }
 
-      const tabs: SheetTab[] = [];
-      const warnings: string[] = [];
+      // Every part is its own request (and Lambda invocation), so a small
+      // pool of workers converts them concurrently, each taking the next part
+      // in order. The first failure reports its error and aborts the rest so
+      // none of them can report progress over it.
+      let converted = 0;
+      let nextIndex = 0;
+      let firstError: string | null = null;
+      const results: ({ tab: SheetTab; warnings: string | null } | null)[] =
+        parts.map(() => null);
+
+      const fail = (error: string) => {
+        if (firstError !== null) return;
+        firstError = error;
+        runController.abort();
+        if (!isLatestRun()) return;
+        setErrorDetails(error);
+        setStatus("Error");
+      };
 
-      for (let i = 0; i < parts.length; i++) {
-        const part = parts[i];
-        setStatus(`Converting to MusicXML… (${i + 1}/${parts.length})`);
-
-        const midiBytes = midiCsvToMidiFileBytes(part.csv);
-        const midiBase64 = midiBytesToBase64(midiBytes);
-
-        const controller = new AbortController();
-        const timeoutId = window.setTimeout(() => controller.abort(), 28_000);
-
-        const res = await fetch(`${baseUrl}/midi-to-musicxml`, {
-          method: "POST",
-          headers: {
-            "content-type": "application/json",
-            accept: "application/json",
-          },
-          body: JSON.stringify({ midiBase64 }),
-          signal: controller.signal,
-        }).finally(() => {
-          window.clearTimeout(timeoutId);
-        });
-
-        const text = await res.text();
-        if (!res.ok) {
-          setErrorDetails(`HTTP ${res.status} (${part.label}): ${text}`);
-          setStatus("Error");
-          return;
+      const worker = async () => {
+        while (nextIndex < parts.length && !runController.signal.aborted) {
+          const index = nextIndex++;
+          try {
+            const result = await convertPartToMusicXml(
+              baseUrl,
+              parts[index],
+              runController.signal
+            );
+            if (!result.ok) {
+              fail(result.error);
+              return;
+            }
+            results[index] = result;
+          } catch (err) {
+            fail(formatUnknownError(err));
+            return;
+          }
+          if (!runController.signal.aborted) {
+            converted += 1;
+            setStatus(`Converting to MusicXML… (${converted}/${parts.length})`);
+          }
         }
+      };
 
-        let data: unknown;
-        try {
-          data = JSON.parse(text);
-        } catch {
-          setErrorDetails(
-            `Backend returned non-JSON (${part.label}):\n\n${text}`
-          );
-          setStatus("Error");
-          return;
-        }
+      setStatus(`Converting to MusicXML… (0/${parts.length})`);
+      await Promise.all(
+        Array.from(
+          { length: Math.min(SHEET_CONVERT_CONCURRENCY, parts.length) },
+          worker
+        )
+      );
 
-        const obj = data as {
-          ok?: unknown;
-          musicxml?: unknown;
-          warnings?: unknown;
-        };
-        if (obj.ok !== true || typeof obj.musicxml !== "string") {
-          setErrorDetails(`Unexpected response (${part.label}):\n\n${text}`);
-          setStatus("Error");
-          return;
-        }
+      // Either a part failed (already reported) or a newer run owns the
+      // status and tabs now.
+      if (runController.signal.aborted) return;
+
+      const tabs: SheetTab[] = [];
+      const warnings: string[] = [];
+
+      for (const result of results) {
+        if (!result) continue;
 
-        if (
-          typeof obj.warnings === "string" &&
-          obj.warnings.trim().length > 0
-        ) {
-          warnings.push(`${part.label}: ${obj.warnings.trim()}`);
+        if (result.warnings) {
+          warnings.push(`${result.tab.label}: ${result.warnings}`);
         }
 
-        tabs.push({ id: part.id, label: part.label, musicXml: obj.musicxml });
+        tabs.push(result.tab);
       }
 
       if (warnings.length > 0) {
@@ -697,6 +786,7 @@ function App() {
       setActiveSheetId(tabs[0]?.id ?? null);
       setStatus("Rendering sheet music…");
     } catch (err) {
+      if (!isLatestRun()) return;
       setErrorDetails(formatUnknownError(err));
       setStatus("Error");
     }
@@ -67,17 +67,6 @@ function isNoteEvent(
   return e.type === "Note_on_c" || e.type === "Note_off_c";
 }
 
-export function midiBytesToBase64(bytes: Uint8Array): string {
-  // btoa expects "binary string"; chunk to avoid call stack / arg limits.
-  let binary = "";
-  const chunkSize = 0x8000;
-  for (let i = 0; i < bytes.length; i += chunkSize) {
-    const chunk = bytes.subarray(i, i + chunkSize);
-    binary += String.fromCharCode(...chunk);
-  }
-  return btoa(binary);
-}
-
 export function midiCsvToMidiFileBytes(csvText: string): Uint8Array {
   const { ppq, events } = parseMidiCsv(csvText);
 